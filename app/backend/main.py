@@ -1,14 +1,16 @@
 from fastapi import FastAPI, UploadFile, File, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
+import csv
+import os
 import pandas as pd
-from io import StringIO
 
+from app.backend.middleware import GzipRequestMiddleware
 from app.rca.embedder import OpenAIEmbedder
 from app.rca.index import RCAIndex
 from app.rca.data_access import read_csv_rows, REQUIRED_COLS
-from app.rca.search import QueryEngine
-from app.rca.schemas import DiagnoseRequest, DiagnoseResponseItem, ComponentsResponse, ModelsResponse
-from app.rca.config import CSV_PATH
+from app.rca.search import QueryEngine, QueryBatcher
+from app.rca.schemas import DiagnoseRequest, DiagnoseResponseItem, ComponentsResponse, ModelsResponse, CatalogResponse
+from app.rca.config import CSV_PATH, INGEST_CHUNK
 from app.rca.utils import unique_components
 from fastapi import Body
 from app.rca.llm_narrow import propose_question, apply_answer
@@ -22,10 +24,21 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(GzipRequestMiddleware)
 
 def _norm(x: str | None) -> str:
     return (x or "").strip().lower()
 
+# Parsed component/model columns of the CSV, reloaded only when its mtime changes
+_csv_cache = {"mtime": None, "df": None}
+
+def _get_csv_df() -> pd.DataFrame:
+    mtime = os.stat(CSV_PATH).st_mtime
+    if _csv_cache["df"] is None or _csv_cache["mtime"] != mtime:
+        df = pd.read_csv(CSV_PATH, usecols=lambda c: c in ("component", "model"), dtype=str)
+        _csv_cache.update(mtime=mtime, df=df)
+    return _csv_cache["df"]
+
 embedder = OpenAIEmbedder()
 index = RCAIndex()
 if not index.load():
@@ -33,7 +46,14 @@ if not index.load():
     embs = embedder.embed_texts([r["fault_description"] for r in rows])
     index.build(embs, rows)
 
+index.start_autosave()
+
 engine = QueryEngine(index=index, embedder=embedder)
+batcher = QueryBatcher(engine)
+
+@app.on_event("shutdown")
+def flush_index():
+    index.flush()
 
 @app.get("/health")
 def health():
@@ -43,7 +63,7 @@ def health():
 def components():
     # Prefer CSV (source of truth)
     try:
-        df = pd.read_csv(CSV_PATH)
+        df = _get_csv_df()
         comps = sorted({ _norm(c) for c in df.get("component", pd.Series([])).astype(str) if str(c).strip() })
     except Exception:
         comps = sorted({ _norm(m.get("component")) for m in index.meta if m.get("component") })
@@ -53,7 +73,7 @@ def components():
 def models(component: str = Query(..., description="Component name (e.g. 'motor')")):
     c = _norm(component)
     try:
-        df = pd.read_csv(CSV_PATH)
+        df = _get_csv_df()
         if "model" not in df.columns:
             return {"models": []}
         sub = df[
@@ -71,12 +91,44 @@ def models(component: str = Query(..., description="Component name (e.g. 'motor'
         })
     return {"models": models}
 
+def _models_by_component() -> dict[str, list[str]]:
+    try:
+        df = _get_csv_df()
+        if "model" not in df.columns:
+            return {}
+        pairs = pd.DataFrame({
+            "component": df["component"].str.strip().str.lower(),
+            "model": df["model"].str.strip().str.lower(),
+        }).dropna()
+        pairs = pairs[(pairs["component"] != "") & (pairs["model"] != "")].drop_duplicates()
+        return pairs.sort_values("model").groupby("component")["model"].agg(list).to_dict()
+    except Exception:
+        # Fall back to meta
+        out: dict[str, set] = {}
+        for m in index.meta:
+            c, mo = _norm(m.get("component")), _norm(m.get("model"))
+            if c and mo:
+                out.setdefault(c, set()).add(mo)
+        return {c: sorted(v) for c, v in out.items()}
+
+@app.get("/catalog", response_model=CatalogResponse)
+def catalog(
+    component: str | None = Query(None, description="Also return this component's models"),
+    all_models: bool = Query(False, description="Also return every component's models"),
+):
+    """/components and /models in one round trip."""
+    out = {"components": components()["components"], "models": []}
+    if component and _norm(component):
+        out["models"] = models(component)["models"]
+    if all_models:
+        out["models_by_component"] = _models_by_component()
+    return out
 
 @app.post("/diagnose", response_model=list[DiagnoseResponseItem])
-def diagnose(req: DiagnoseRequest):
+async def diagnose(req: DiagnoseRequest):
     if not req.query.strip():
         raise HTTPException(400, "Query must not be empty")
-    results = engine.diagnose(
+    results = await batcher.submit(
         req.query,
         top_k=req.top_k,
         component=_norm(req.component) if req.component else None,
@@ -84,47 +136,78 @@ def diagnose(req: DiagnoseRequest):
     )
     return results
 
+def _append_csv(new_rows: list[dict]):
+    """Append rows to the CSV in its existing column order, writing a header only for a new file."""
+    cols = ["component", "fault_description", "root_cause", "corrective_action", "model"]
+    header_needed = not os.path.exists(CSV_PATH) or os.path.getsize(CSV_PATH) == 0
+    if not header_needed:
+        with open(CSV_PATH, newline="", encoding="utf-8") as f:
+            cols = next(csv.reader(f), None) or cols
+        # Hand-edited CSVs often lack a final newline; don't glue our first row onto the last
+        with open(CSV_PATH, "rb+") as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) not in (b"\n", b"\r"):
+                f.write(b"\n")
+    with open(CSV_PATH, "a", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=cols, restval="", extrasaction="ignore")
+        if header_needed:
+            writer.writeheader()
+        writer.writerows(new_rows)
+    if _csv_cache["df"] is not None:
+        added = pd.DataFrame(new_rows).reindex(columns=list(_csv_cache["df"].columns)).astype(str)
+        _csv_cache.update(
+            mtime=os.stat(CSV_PATH).st_mtime,
+            df=pd.concat([_csv_cache["df"], added], ignore_index=True),
+        )
+
 @app.post("/ingest")
-async def ingest(file: UploadFile = File(...)):
+def ingest(file: UploadFile = File(...)):
     """Upload CSV with columns:
     required: component, fault_description, root_cause, corrective_action
     optional: model
+
+    The upload is parsed in chunks of INGEST_CHUNK rows; each chunk is de-duplicated,
+    embedded, indexed and appended to the CSV before the next one is read.
     """
     if not file.filename.lower().endswith(".csv"):
         raise HTTPException(400, "Please upload a CSV file")
-    content = (await file.read()).decode("utf-8", errors="replace")
-    df = pd.read_csv(StringIO(content))
-    missing = [c for c in REQUIRED_COLS if c not in df.columns]
-    if missing:
-        raise HTTPException(400, f"Missing required column(s): {', '.join(missing)}")
-
-    # Coerce and normalise
-    for col in ["component", "fault_description", "root_cause", "corrective_action"]:
-        df[col] = df[col].astype(str)
-    if "model" not in df.columns:
-        df["model"] = ""
-    else:
-        df["model"] = df["model"].astype(str)
+    reader = pd.read_csv(
+        file.file, chunksize=INGEST_CHUNK, dtype=str,
+        encoding="utf-8", encoding_errors="replace",
+    )
 
-    # De-dup by exact fault_description already in index
-    rows = df[["component", "fault_description", "root_cause", "corrective_action", "model"]].to_dict(orient="records")
-    existing = set((r.get("fault_description") or "") for r in index.meta)
-    new_rows = [r for r in rows if (r.get("fault_description") or "") not in existing]
-    if not new_rows:
-        return {"added": 0, "message": "No new rows"}
+    added = 0
+    for df in reader:
+        missing = [c for c in REQUIRED_COLS if c not in df.columns]
+        if missing:
+            raise HTTPException(400, f"Missing required column(s): {', '.join(missing)}")
+
+        # Coerce and normalise (vectorised; component/model keyed the same way as _norm)
+        if "model" not in df.columns:
+            df["model"] = ""
+        df = df[["component", "fault_description", "root_cause", "corrective_action", "model"]].fillna("")
+        df["component"] = df["component"].str.strip().str.lower()
+        df["model"] = df["model"].str.strip().str.lower()
 
-    embs = embedder.embed_texts([r["fault_description"] for r in new_rows])
-    index.add(embs, new_rows)
+        # The embeddings API rejects empty inputs, so rows without a description are skipped
+        df = df[df["fault_description"].str.strip() != ""]
 
-    # Persist to CSV
-    try:
-        csv_df = pd.read_csv(CSV_PATH)
-    except Exception:
-        csv_df = pd.DataFrame(columns=["component", "fault_description", "root_cause", "corrective_action", "model"])
-    csv_df = pd.concat([csv_df, pd.DataFrame(new_rows)], ignore_index=True)
-    csv_df.to_csv(CSV_PATH, index=False)
+        # De-dup by exact fault_description already in index (earlier chunks are indexed by now)
+        df = df.drop_duplicates("fault_description")
+        df = df[~df["fault_description"].map(index.has_fault).astype(bool)]
+        if df.empty:
+            continue
+        new_rows = df.to_dict(orient="records")
 
-    return {"added": len(new_rows)}
+        embs = embedder.embed_texts([r["fault_description"] for r in new_rows])
+        index.add(embs, new_rows)
+        engine.cache.clear()
+        _append_csv(new_rows)
+        added += len(new_rows)
+
+    if not added:
+        return {"added": 0, "message": "No new rows"}
+    return {"added": added}
 
     if "model" not in df.columns:
         df["model"] = ""
@@ -134,9 +217,13 @@ async def ingest(file: UploadFile = File(...)):
 @app.post("/narrow/next")
 def narrow_next(
     query: str = Body(...),
-    candidates: list[dict] = Body(..., description="Top matches from /diagnose (as returned)"),
+    candidates: list[dict] = Body(default=[], description="Top matches from /diagnose (as returned)"),
+    candidate_ids: list[int] = Body(default=[], description="Alternatively, just the `id`s of those matches"),
     asked: list[dict] = Body(default=[], description="History: [{'question': str, 'keywords': [..]}]"),
 ):
+    if candidate_ids:
+        candidates = engine.lookup(candidate_ids[:5])
+
     # Build ban lists from what’s already been asked
     banned_keywords = []
     banned_questions = []
@@ -159,7 +246,13 @@ def narrow_next(
 def narrow_answer(
     answer: bool = Body(..., description="True for Yes, False for No"),
     keywords: list[str] = Body(...),
-    candidates: list[dict] = Body(...),
+    candidates: list[dict] = Body(default=[]),
+    candidate_ids: list[int] = Body(default=[], description="Alternatively, just the `id`s of the candidates"),
+    similarities: list[float] = Body(default=[], description="Current similarity of each candidate_id"),
 ):
+    if candidate_ids:
+        if len(similarities) != len(candidate_ids):
+            raise HTTPException(status_code=422, detail="similarities must match candidate_ids")
+        candidates = engine.lookup(candidate_ids, similarities)
     re_ranked = apply_answer(answer, keywords, candidates)
     return {"candidates": re_ranked}
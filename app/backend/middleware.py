@@ -0,0 +1,59 @@
+import zlib
+from starlette.responses import PlainTextResponse
+
+# JSON bodies are small; anything bigger is refused before it can exhaust memory
+MAX_COMPRESSED_BYTES = 1 * 1024 * 1024
+MAX_INFLATED_BYTES = 4 * 1024 * 1024
+
+class GzipRequestMiddleware:
+    """Inflates request bodies sent with `Content-Encoding: gzip` before routing,
+    so endpoints see plain JSON. Other requests pass through untouched.
+    Compressed and inflated sizes are both capped (413 beyond them)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        headers = scope["headers"]
+        encodings = [v.strip().lower() for k, v in headers if k == b"content-encoding"]
+        if encodings != [b"gzip"]:
+            return await self.app(scope, receive, send)
+
+        chunks = []
+        size = 0
+        while True:
+            msg = await receive()
+            if msg["type"] == "http.disconnect":
+                return
+            chunk = msg.get("body", b"")
+            size += len(chunk)
+            if size > MAX_COMPRESSED_BYTES:
+                return await PlainTextResponse("Request body too large", status_code=413)(scope, receive, send)
+            chunks.append(chunk)
+            if not msg.get("more_body", False):
+                break
+        inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)  # gzip container
+        try:
+            body = inflater.decompress(b"".join(chunks), MAX_INFLATED_BYTES)
+        except zlib.error:
+            return await PlainTextResponse("Invalid gzip body", status_code=400)(scope, receive, send)
+        if inflater.unconsumed_tail:
+            return await PlainTextResponse("Request body too large", status_code=413)(scope, receive, send)
+        if not inflater.eof:
+            return await PlainTextResponse("Invalid gzip body", status_code=400)(scope, receive, send)
+
+        scope = dict(scope)
+        scope["headers"] = [(k, v) for k, v in headers if k not in (b"content-encoding", b"content-length")]
+        scope["headers"].append((b"content-length", str(len(body)).encode()))
+        delivered = False
+
+        async def receive_inflated():
+            nonlocal delivered
+            if not delivered:
+                delivered = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        await self.app(scope, receive_inflated, send)
@@ -20,8 +20,7 @@ def main(rebuild: bool = False):
         index.build(embs, rows)
         print("Built fresh index from", len(rows), "rows")
     else:
-        existing_texts = set(r["fault_description"] for r in index.meta)
-        new_rows: List[Dict] = [r for r in rows if r["fault_description"] not in existing_texts]
+        new_rows: List[Dict] = [r for r in rows if not index.has_fault(r["fault_description"])]
         if new_rows:
             embs = embedder.embed_texts([r["fault_description"] for r in new_rows])
             index.add(embs, new_rows)
@@ -8,6 +8,32 @@ INDEX_DIR.mkdir(parents=True, exist_ok=True)
 CSV_PATH = DATA_DIR / os.getenv("FAULTS_CSV", "faults.csv")
 FAISS_INDEX_PATH = INDEX_DIR / "index.faiss"
 META_PATH = INDEX_DIR / "meta.json"
+VECS_PATH = INDEX_DIR / "vecs.npy"
+# With autosave on (the API), index writes are debounced to at most one per interval
+INDEX_SAVE_INTERVAL = float(os.getenv("INDEX_SAVE_INTERVAL", "1.0"))
 
 EMBED_MODEL = os.getenv("EMBED_MODEL", "text-embedding-3-small")
 EMBED_BATCH = int(os.getenv("EMBED_BATCH", "64"))
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "8"))
+EMBED_CACHE_PATH = INDEX_DIR / os.getenv("EMBED_CACHE_FILE", "embed_cache.sqlite")
+
+SEMCACHE_TAU = float(os.getenv("RCA_SEMCACHE_TAU", "0.97"))
+SEMCACHE_SIZE = int(os.getenv("RCA_SEMCACHE_SIZE", "512"))
+
+# Switch from exact IndexFlatIP to HNSW once the corpus reaches this size
+HNSW_THRESHOLD = int(os.getenv("HNSW_THRESHOLD", "2000"))
+HNSW_M = int(os.getenv("HNSW_M", "32"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "200"))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "64"))
+# Store the FAISS index and per-component sub-indices as 8-bit scalar-quantised codes
+# (approximate scores). Shrinks the FAISS copies ~4x; the float32 vecs matrix used for
+# filtered/exact search is unaffected (memory-mapped after load, in RAM after an add).
+# Flat SQ8 indices are retrained on every add; an HNSW SQ8 index keeps the ranges it was
+# built with, so vectors added later may be clipped until the next full build
+USE_SQ8 = os.getenv("USE_SQ8", "false").strip().lower() in ("1", "true", "yes")
+
+INGEST_CHUNK = int(os.getenv("INGEST_CHUNK", "10000"))
+
+# /diagnose micro-batching: queries arriving within the window share one embed + search
+QBATCH_MAX = int(os.getenv("QBATCH_MAX", "32"))
+QBATCH_WINDOW_MS = float(os.getenv("QBATCH_WINDOW_MS", "10"))
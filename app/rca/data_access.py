@@ -1,25 +1,23 @@
-from typing import List, Dict
-import pandas as pd
+from typing import Dict, Iterator, List
+import csv
 from .config import CSV_PATH
 
 REQUIRED_COLS = ["component", "fault_description", "root_cause", "corrective_action"]
 OPTIONAL_COLS = ["model"]
 
-def read_csv_rows(path=CSV_PATH) -> List[Dict]:
-    # Be tolerant of optional 'model' column
-    df = pd.read_csv(path, quotechar='"', skipinitialspace=True, engine="python")
-    for col in REQUIRED_COLS:
-        if col not in df.columns:
-            raise ValueError(f"Missing required column: {col}")
-    # Ensure all required present; add optional if missing
-    for col in REQUIRED_COLS + OPTIONAL_COLS:
-        if col not in df.columns:
-            df[col] = ""
-        df[col] = df[col].astype(str)
-    return df[REQUIRED_COLS + OPTIONAL_COLS].to_dict(orient="records")
-
-    for col in REQUIRED_COLS + OPTIONAL_COLS:
-        if col not in df.columns:
-            df[col] = ""
-        df[col] = df[col].fillna("").astype(str)
+def iter_csv_rows(path=CSV_PATH) -> Iterator[Dict]:
+    # Be tolerant of optional 'model' column; missing/empty cells become ""
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f, quotechar='"', skipinitialspace=True)
+        header = reader.fieldnames or []
+        for col in REQUIRED_COLS:
+            if col not in header:
+                raise ValueError(f"Missing required column: {col}")
+        for row in reader:
+            # Rows without a description can't be embedded (the API rejects empty input)
+            if not (row.get("fault_description") or "").strip():
+                continue
+            yield {k: (row.get(k) or "") for k in REQUIRED_COLS + OPTIONAL_COLS}
 
+def read_csv_rows(path=CSV_PATH) -> List[Dict]:
+    return list(iter_csv_rows(path))
@@ -0,0 +1,50 @@
+from __future__ import annotations
+from typing import Dict, List
+import hashlib
+import sqlite3
+import threading
+from pathlib import Path
+import numpy as np
+
+from .config import EMBED_CACHE_PATH
+
+
+def text_key(model: str, text: str) -> bytes:
+    return hashlib.sha256((model + text).encode("utf-8")).digest()
+
+
+class EmbeddingCache:
+    """Persistent SQLite cache of embeddings keyed by sha256(model + text).
+    Vectors are stored as raw float32 bytes.
+    """
+
+    # SQLite's default host-parameter limit is 999
+    _CHUNK = 900
+
+    def __init__(self, path: Path = EMBED_CACHE_PATH):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(str(path), check_same_thread=False)
+        with self.lock:
+            self.conn.execute("CREATE TABLE IF NOT EXISTS embeddings (hash BLOB PRIMARY KEY, vec BLOB NOT NULL)")
+            self.conn.commit()
+
+    def get_many(self, keys: List[bytes]) -> Dict[bytes, np.ndarray]:
+        out: Dict[bytes, np.ndarray] = {}
+        uniq = list(dict.fromkeys(keys))
+        with self.lock:
+            for i in range(0, len(uniq), self._CHUNK):
+                chunk = uniq[i:i+self._CHUNK]
+                marks = ",".join("?" * len(chunk))
+                cur = self.conn.execute(f"SELECT hash, vec FROM embeddings WHERE hash IN ({marks})", chunk)
+                for h, blob in cur:
+                    out[bytes(h)] = np.frombuffer(blob, dtype=np.float32)
+        return out
+
+    def put_many(self, keys: List[bytes], vecs: np.ndarray):
+        rows = [(k, np.ascontiguousarray(v, dtype=np.float32).tobytes()) for k, v in zip(keys, vecs)]
+        if not rows:
+            return
+        with self.lock:
+            self.conn.executemany("INSERT OR IGNORE INTO embeddings (hash, vec) VALUES (?, ?)", rows)
+            self.conn.commit()
@@ -1,24 +1,57 @@
 from typing import List
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 from openai import OpenAI
-from .config import EMBED_MODEL, EMBED_BATCH
+from .config import EMBED_MODEL, EMBED_BATCH, EMBED_CONCURRENCY
+from .embed_cache import EmbeddingCache, text_key
 
 class OpenAIEmbedder:
-    """Thin wrapper around OpenAI embeddings."""
+    """Thin wrapper around OpenAI embeddings.
+    Vectors are cached on disk, so only unseen texts hit the API.
+    """
     def __init__(self):
         self.client = OpenAI()
+        self.cache = EmbeddingCache()
+
+    def _fetch_batch(self, batch: List[str]) -> np.ndarray:
+        resp = self.client.embeddings.create(model=EMBED_MODEL, input=batch)
+        batch_vecs = [d.embedding for d in resp.data]
+        return np.array(batch_vecs, dtype=np.float32)
+
+    def _fetch(self, texts: List[str]) -> np.ndarray:
+        batches = [texts[i:i+EMBED_BATCH] for i in range(0, len(texts), EMBED_BATCH)]
+        if len(batches) == 1:
+            return self._fetch_batch(batches[0])
+        # Up to EMBED_CONCURRENCY requests in flight; map() keeps batch order
+        with ThreadPoolExecutor(max_workers=min(EMBED_CONCURRENCY, len(batches))) as pool:
+            arrs = list(pool.map(self._fetch_batch, batches))
+        return np.vstack(arrs)
 
     def embed_texts(self, texts: List[str]) -> np.ndarray:
-        arrs = []
-        for i in range(0, len(texts), EMBED_BATCH):
-            batch = texts[i:i+EMBED_BATCH]
-            resp = self.client.embeddings.create(model=EMBED_MODEL, input=batch)
-            batch_vecs = [d.embedding for d in resp.data]
-            arrs.append(np.array(batch_vecs, dtype=np.float32))
-        if not arrs:
+        if not texts:
             return np.zeros((0, 0), dtype=np.float32)
-        return np.vstack(arrs)
+        keys = [text_key(EMBED_MODEL, t) for t in texts]
+        cached = self.cache.get_many(keys)
+
+        # Only send each uncached string once, even if repeated in the input
+        uncached_texts: List[str] = []
+        uncached_keys: List[bytes] = []
+        seen = set()
+        for k, t in zip(keys, texts):
+            if k not in cached and k not in seen:
+                seen.add(k)
+                uncached_keys.append(k)
+                uncached_texts.append(t)
+        if uncached_texts:
+            fresh = self._fetch(uncached_texts)
+            self.cache.put_many(uncached_keys, fresh)
+            cached.update(zip(uncached_keys, fresh))
+
+        dim = len(next(iter(cached.values())))
+        out = np.empty((len(texts), dim), dtype=np.float32)
+        for i, k in enumerate(keys):
+            out[i] = cached[k]
+        return out
 
     def embed_text(self, text: str) -> np.ndarray:
-        resp = self.client.embeddings.create(model=EMBED_MODEL, input=[text])
-        return np.array(resp.data[0].embedding, dtype=np.float32)
+        return self.embed_texts([text])[0]
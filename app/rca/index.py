@@ -1,8 +1,10 @@
 from __future__ import annotations
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, List, NamedTuple, Optional, Tuple
 import json
+import os
 from pathlib import Path
 import threading
+import time
 import numpy as np
 
 try:
@@ -10,81 +12,328 @@ try:
 except ImportError:
     faiss = None
 
-from .config import FAISS_INDEX_PATH, META_PATH
+try:
+    import xxhash  # type: ignore
+except ImportError:
+    xxhash = None
+
+try:
+    import orjson  # type: ignore
+except ImportError:
+    orjson = None
+
+from .config import (
+    FAISS_INDEX_PATH, META_PATH, VECS_PATH,
+    HNSW_THRESHOLD, HNSW_M, HNSW_EF_CONSTRUCTION, HNSW_EF_SEARCH, USE_SQ8,
+    INDEX_SAVE_INTERVAL,
+)
 
 def _normalise(v: np.ndarray) -> np.ndarray:
-    denom = np.linalg.norm(v, axis=1, keepdims=True) + 1e-10 if v.ndim == 2 else np.linalg.norm(v) + 1e-10
-    return v / denom
+    """L2-normalise a contiguous float32 vector or row matrix in place and return it."""
+    rows = v.reshape(1, -1) if v.ndim == 1 else v
+    if faiss is not None:
+        faiss.normalize_L2(rows)
+    else:
+        norms = np.einsum("ij,ij->i", rows, rows)
+        np.sqrt(norms, out=norms)
+        rows /= norms[:, None] + 1e-10
+    return v
+
+def _key(x: Optional[str]) -> str:
+    return (x or "").lower()
+
+def _desc_hash(desc: str) -> int:
+    if xxhash is not None:
+        return xxhash.xxh64_intdigest(desc.encode("utf-8"))
+    return hash(desc)
+
+def _topk(sims: np.ndarray, k: int) -> np.ndarray:
+    """Column indices of the k largest values in each row of a (B, N) matrix, best first.
+    O(N) argpartition selection, then only the k survivors are sorted."""
+    if k < sims.shape[1]:
+        idx = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+        order = np.argsort(-np.take_along_axis(sims, idx, axis=1), axis=1)
+        return np.take_along_axis(idx, order, axis=1)
+    return np.argsort(-sims, axis=1)[:, :k]
+
+def _sq8_index(vecs: np.ndarray):
+    """IndexScalarQuantizer (8-bit, inner product) trained on and populated with vecs."""
+    import faiss as _faiss
+    idx = _faiss.IndexScalarQuantizer(vecs.shape[1], _faiss.ScalarQuantizer.QT_8bit, _faiss.METRIC_INNER_PRODUCT)
+    idx.train(vecs)
+    idx.add(vecs)
+    return idx
+
+def _build_faiss_index(vecs: np.ndarray):
+    """Return a FAISS index populated with vecs.
+    Exact IndexFlatIP for small corpora, HNSW once N reaches HNSW_THRESHOLD;
+    with USE_SQ8 the stored vectors are 8-bit scalar-quantised instead of float32.
+    """
+    import faiss as _faiss
+    dim, n = vecs.shape[1], len(vecs)
+    ip = _faiss.METRIC_INNER_PRODUCT
+    if n >= HNSW_THRESHOLD:
+        if USE_SQ8:
+            idx = _faiss.IndexHNSWSQ(dim, _faiss.ScalarQuantizer.QT_8bit, HNSW_M, ip)
+        else:
+            idx = _faiss.IndexHNSWFlat(dim, HNSW_M, ip)
+        idx.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        idx.hnsw.efSearch = HNSW_EF_SEARCH
+    elif USE_SQ8:
+        return _sq8_index(vecs)
+    else:
+        idx = _faiss.IndexFlatIP(dim)
+    if not idx.is_trained:
+        idx.train(vecs)
+    idx.add(vecs)
+    return idx
+
+def _extend_by_component(
+    by_component: Dict[str, Tuple[object, np.ndarray]],
+    vecs: np.ndarray,
+    component_arr: np.ndarray,
+    start: int,
+    dim: Optional[int],
+) -> Dict[str, Tuple[object, np.ndarray]]:
+    """Copy of by_component with rows [start:] added. Touched FAISS sub-indices are
+    cloned before adding so readers of the old mapping are never mutated under.
+    With USE_SQ8 a touched sub-index is instead rebuilt and retrained on all of its
+    component's vectors: quantiser ranges are fixed at train time, and adding vectors
+    outside them would clip their scores."""
+    out = dict(by_component)
+    if not len(vecs):
+        return out
+    comps = component_arr[start:]
+    for c in set(comps.tolist()):
+        ids = start + np.flatnonzero(comps == c)
+        sub, ids_map = out.get(c, (None, np.zeros(0, dtype="int64")))
+        ids_map = np.concatenate([ids_map, ids])
+        if faiss is not None:
+            if USE_SQ8:
+                sub = _sq8_index(np.ascontiguousarray(vecs[ids_map]))
+            else:
+                sub = faiss.IndexFlatIP(dim) if sub is None else faiss.clone_index(sub)
+                sub.add(np.ascontiguousarray(vecs[ids]))
+        out[c] = (sub, ids_map)
+    return out
+
+def _thin_rows(rows: List[Dict]) -> List[Dict]:
+    out = []
+    for r in rows:
+        r2 = dict(r)
+        # Ensure optional keys exist
+        r2.setdefault("model", "")
+        r2.setdefault("component", "")
+        out.append(r2)
+    return out
+
+class _State(NamedTuple):
+    faiss_index: object
+    meta: List[Dict]
+    vecs: np.ndarray
+    component_arr: np.ndarray
+    model_arr: np.ndarray
+    # normalised component -> (FAISS sub-index or None, local id -> global meta id)
+    by_component: Dict[str, Tuple[object, np.ndarray]]
+
+_EMPTY = _State(
+    None, [], np.zeros((0, 0), dtype="float32"),
+    np.zeros(0, dtype=object), np.zeros(0, dtype=object), {},
+)
 
 class RCAIndex:
     """In-memory FAISS (or numpy) index + metadata with cosine similarity.
-    Stores vectors in meta so filtered search can always run, even without FAISS.
-    Thread-safe add/search via a lock.
+    Vectors live in one contiguous (N, d) float32 matrix kept in sync with meta
+    (persisted as vecs.npy, not inside meta.json), so filtered search can always
+    run, even without FAISS.
+    Everything search reads is one immutable _State tuple: search takes no lock and
+    works on the snapshot it started with, while build/add assemble a new state
+    under a write lock and publish it with a single attribute assignment.
     """
 
     def __init__(self):
-        self.lock = threading.Lock()
-        self.meta: List[Dict] = []
-        self.faiss_index = None
+        self._write_lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._state = _EMPTY
+        # 64-bit hashes of every fault_description, for O(1) de-dup without keeping strings
+        self._desc_hashes: set[int] = set()
+        self._autosave = False
+        self._dirty = False
         self.dim = None
 
+    @property
+    def meta(self) -> List[Dict]:
+        return self._state.meta
+
+    @property
+    def vecs(self) -> np.ndarray:
+        return self._state.vecs
+
+    @property
+    def faiss_index(self):
+        return self._state.faiss_index
+
+    def _publish(self, faiss_index, meta: List[Dict], vecs: np.ndarray):
+        """Build the derived columns from scratch and swap in the new state."""
+        component_arr = np.array([_key(m.get("component")) for m in meta], dtype=object)
+        model_arr = np.array([_key(m.get("model")) for m in meta], dtype=object)
+        by_component = _extend_by_component({}, vecs, component_arr, 0, self.dim)
+        self._desc_hashes = {_desc_hash(m.get("fault_description") or "") for m in meta}
+        self._state = _State(faiss_index, meta, vecs, component_arr, model_arr, by_component)
+
+    def has_fault(self, desc: str) -> bool:
+        return _desc_hash(desc or "") in self._desc_hashes
+
     def save(self):
-        META_PATH.parent.mkdir(parents=True, exist_ok=True)
-        with open(META_PATH, "w", encoding="utf-8") as f:
-            json.dump(self.meta, f, ensure_ascii=False, indent=2)
-        if self.faiss_index is not None and faiss is not None:
-            import faiss as _faiss
-            _faiss.write_index(self.faiss_index, str(FAISS_INDEX_PATH))
+        with self._save_lock:
+            # Snapshot under the lock so an older state can never overwrite a newer save
+            st = self._state
+            META_PATH.parent.mkdir(parents=True, exist_ok=True)
+            # Every file goes through a temp file + os.replace: a crash mid-write never
+            # leaves a truncated index, and a memory-mapped vecs.npy is never truncated
+            tmp = META_PATH.with_suffix(".json.tmp")
+            if orjson is not None:
+                tmp.write_bytes(orjson.dumps(st.meta, option=orjson.OPT_NON_STR_KEYS))
+            else:
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(st.meta, f, ensure_ascii=False)
+            os.replace(tmp, META_PATH)
+            tmp = VECS_PATH.with_suffix(".tmp.npy")
+            np.save(tmp, st.vecs)
+            os.replace(tmp, VECS_PATH)
+            if st.faiss_index is not None and faiss is not None:
+                import faiss as _faiss
+                tmp = FAISS_INDEX_PATH.with_suffix(".faiss.tmp")
+                _faiss.write_index(st.faiss_index, str(tmp))
+                os.replace(tmp, FAISS_INDEX_PATH)
+
+    def flush(self):
+        """Save now if an add() since the last save is still pending."""
+        if self._dirty:
+            self._dirty = False
+            self.save()
+
+    def start_autosave(self, interval: float = INDEX_SAVE_INTERVAL):
+        """Debounce persistence: from now on add() only marks the index dirty and a
+        daemon thread flushes at most once per interval. Call flush() on shutdown."""
+        if self._autosave:
+            return
+        self._autosave = True
+
+        def _loop():
+            delay, failing = interval, False
+            while True:
+                time.sleep(delay)
+                try:
+                    self.flush()
+                except Exception as e:
+                    self._dirty = True
+                    if not failing:
+                        print("Index autosave failed, retrying with backoff:", e)
+                    failing = True
+                    delay = min(delay * 2, max(interval, 300.0))
+                    continue
+                if failing:
+                    print("Index autosave recovered")
+                delay, failing = interval, False
+
+        threading.Thread(target=_loop, name="rca-index-autosave", daemon=True).start()
 
     def load(self) -> bool:
         if META_PATH.exists():
-            self.meta = json.loads(Path(META_PATH).read_text(encoding="utf-8"))
+            raw = Path(META_PATH).read_bytes()
+            meta = orjson.loads(raw) if orjson is not None else json.loads(raw)
         else:
             return False
         if FAISS_INDEX_PATH.exists() and faiss is not None:
             import faiss as _faiss
-            self.faiss_index = _faiss.read_index(str(FAISS_INDEX_PATH))
-            self.dim = self.faiss_index.d
+            faiss_index = _faiss.read_index(str(FAISS_INDEX_PATH))
+            if hasattr(faiss_index, "hnsw"):
+                faiss_index.hnsw.efSearch = HNSW_EF_SEARCH
+        else:
+            faiss_index = None
+
+        legacy = bool(meta) and "embedding" in meta[0]
+        if VECS_PATH.exists():
+            vecs = np.load(VECS_PATH, mmap_mode="r")
+        elif legacy:
+            # Older indices stored each vector inline in meta
+            vecs = np.array([m.get("embedding", []) for m in meta], dtype="float32")
+        elif faiss_index is not None and faiss_index.ntotal:
+            vecs = faiss_index.reconstruct_n(0, faiss_index.ntotal)
         else:
-            self.faiss_index = None
-            self.dim = None if not self.meta else len(self.meta[0].get("embedding", []))
+            vecs = np.zeros((0, 0), dtype="float32")
+        for m in meta:
+            m.pop("embedding", None)
+
+        # The three files are replaced one after another, so a crash mid-save can leave
+        # them out of step; report "no index" and let the caller rebuild from the CSV
+        if len(vecs) != len(meta) or (faiss_index is not None and faiss_index.ntotal != len(meta)):
+            print(
+                f"Index files disagree (meta={len(meta)}, vecs={len(vecs)}, "
+                f"faiss={faiss_index.ntotal if faiss_index is not None else '-'}); ignoring saved index"
+            )
+            return False
+
+        with self._write_lock:
+            if faiss_index is not None:
+                self.dim = faiss_index.d
+            else:
+                self.dim = None if not meta else vecs.shape[1]
+            self._publish(faiss_index, meta, vecs)
+        if legacy or not VECS_PATH.exists():
+            # Rewrite once in the thin format
+            self.save()
+        self.warm()
         return True
 
+    def warm(self):
+        """Pay first-query costs at startup: one dummy FAISS search now, and page the
+        memory-mapped vectors in from a background thread."""
+        st = self._state
+        if st.faiss_index is not None and st.faiss_index.ntotal:
+            st.faiss_index.search(np.zeros((1, self.dim), dtype="float32"), 1)
+        if isinstance(st.vecs, np.memmap):
+            vecs = st.vecs
+            threading.Thread(target=lambda: float(vecs.sum()), daemon=True).start()
+
     def build(self, embeddings: np.ndarray, rows: List[Dict]):
-        with self.lock:
-            vecs = _normalise(embeddings.astype("float32"))
+        with self._write_lock:
+            vecs = _normalise(np.array(embeddings, dtype="float32"))
             self.dim = vecs.shape[1]
-            if faiss is not None:
-                import faiss as _faiss
-                self.faiss_index = _faiss.IndexFlatIP(self.dim)
-                self.faiss_index.add(vecs)
-            self.meta = []
-            for i, r in enumerate(rows):
-                r2 = dict(r)
-                r2["embedding"] = vecs[i].tolist()
-                # Ensure optional keys exist
-                r2.setdefault("model", "")
-                r2.setdefault("component", "")
-                self.meta.append(r2)
+            faiss_index = _build_faiss_index(vecs) if faiss is not None else None
+            self._publish(faiss_index, _thin_rows(rows), vecs)
         self.save()
 
     def add(self, embeddings: np.ndarray, rows: List[Dict]):
-        with self.lock:
-            vecs = _normalise(embeddings.astype("float32"))
+        with self._write_lock:
+            old = self._state
+            vecs = _normalise(np.array(embeddings, dtype="float32"))
             if self.dim is None:
                 self.dim = vecs.shape[1]
-            if faiss is not None and self.faiss_index is None:
-                import faiss as _faiss
-                self.faiss_index = _faiss.IndexFlatIP(self.dim)
+            all_vecs = vecs if not len(old.vecs) else np.vstack([old.vecs, vecs])
+            faiss_index = old.faiss_index
             if faiss is not None:
-                self.faiss_index.add(vecs)
-            for i, r in enumerate(rows):
-                r2 = dict(r)
-                r2["embedding"] = vecs[i].tolist()
-                r2.setdefault("model", "")
-                r2.setdefault("component", "")
-                self.meta.append(r2)
-        self.save()
+                n = len(all_vecs)
+                flat = faiss_index is not None and not hasattr(faiss_index, "hnsw")
+                if faiss_index is None or (flat and (n >= HNSW_THRESHOLD or USE_SQ8)):
+                    # First add, the corpus just outgrew exact search, or a flat SQ8 index
+                    # whose ranges must be retrained to cover the new vectors: rebuild
+                    faiss_index = _build_faiss_index(all_vecs)
+                else:
+                    faiss_index = faiss.clone_index(faiss_index)
+                    faiss_index.add(vecs)
+            new_meta = _thin_rows(rows)
+            start = len(old.meta)
+            component_arr = np.concatenate([old.component_arr, np.array([_key(m["component"]) for m in new_meta], dtype=object)])
+            model_arr = np.concatenate([old.model_arr, np.array([_key(m["model"]) for m in new_meta], dtype=object)])
+            by_component = _extend_by_component(old.by_component, all_vecs, component_arr, start, self.dim)
+            self._desc_hashes.update(_desc_hash(m.get("fault_description") or "") for m in new_meta)
+            self._state = _State(faiss_index, old.meta + new_meta, all_vecs, component_arr, model_arr, by_component)
+        if self._autosave:
+            self._dirty = True
+        else:
+            self.save()
 
     def search(
         self,
@@ -94,16 +343,58 @@ class RCAIndex:
         model: Optional[str] = None,
     ) -> List[Tuple[int, float]]:
         """Return list of (meta_index, similarity) for the best matches."""
-        q = _normalise(query_vec.astype("float32")).reshape(1, -1)
-        with self.lock:
-            ids = list(range(len(self.meta)))
+        return self.search_batch(np.asarray(query_vec).reshape(1, -1), top_k, component, model)[0]
+
+    def search_batch(
+        self,
+        query_vecs: np.ndarray,
+        top_k: int = 3,
+        component: Optional[str] = None,
+        model: Optional[str] = None,
+    ) -> List[List[Tuple[int, float]]]:
+        """search() for a (B, d) matrix of queries sharing the same filters, in one pass."""
+        Q = _normalise(np.array(query_vecs, dtype="float32"))
+        empty: List[List[Tuple[int, float]]] = [[] for _ in range(len(Q))]
+        st = self._state  # one snapshot for the whole call; writers swap, never mutate
+        if not len(st.meta):
+            return empty
+        if faiss is not None and not model:
+            # FAISS path: whole index, or the component's own sub-index
             if component:
-                ids = [i for i in ids if (self.meta[i].get("component") or "").lower() == component.lower()]
-            if model:
-                ids = [i for i in ids if (self.meta[i].get("model") or "").lower() == model.lower()]
-            if not ids:
-                return []
-            vecs = np.array([self.meta[i]["embedding"] for i in ids], dtype="float32")
-            sims = (vecs @ q.T).ravel()
-            order = np.argsort(-sims)[:top_k]
-            return [(int(ids[o]), float(sims[o])) for o in order]
+                sub = st.by_component.get(component.lower())
+                if sub is None:
+                    return empty
+                fi, ids_map = sub
+            else:
+                fi, ids_map = st.faiss_index, None
+            if fi is not None and fi.ntotal:
+                D, I = fi.search(Q, min(top_k, fi.ntotal))
+                return [
+                    [(int(i if ids_map is None else ids_map[i]), float(d)) for d, i in zip(drow, irow) if i >= 0]
+                    for drow, irow in zip(D, I)
+                ]
+
+        # numpy path: slice the component's rows directly, then mask by model
+        if component:
+            sub = st.by_component.get(component.lower())
+            if sub is None:
+                return empty
+            ids = sub[1]
+            vecs = st.vecs[ids]
+        else:
+            ids = None
+            vecs = st.vecs
+        sims = Q @ vecs.T
+        n = sims.shape[1]
+        if model:
+            models = st.model_arr if ids is None else st.model_arr[ids]
+            mask = models == model.lower()
+            n = int(mask.sum())
+            if not n:
+                return empty
+            sims[:, ~mask] = -np.inf
+        orders = _topk(sims, min(top_k, n))
+        return [
+            [(int(o if ids is None else ids[o]), float(row[o])) for o in order]
+            for row, order in zip(sims, orders)
+        ]
@@ -19,6 +19,9 @@ Rules:
 - Do NOT include any other text.
 """
 
+ANSWER_BOOST = 0.07
+ANSWER_CAP = 0.15
+
 def _overlaps_banned(kws: List[str], banned: Set[str]) -> bool:
     return any((k or "").strip().lower() in banned for k in kws)
 
@@ -85,15 +88,14 @@ def apply_answer(answer_yes: bool, keywords: List[str], candidates: List[Dict[st
       +0.07 per keyword hit on Yes; -0.07 per hit on No (cap +/- 0.15 total)
     Search in merged text: fault + cause + action (lowercased).
     """
-    BOOST = 0.07
-    CAP = 0.15
+    kws = [k.lower() for k in keywords if k]
     for c in candidates:
         text = " ".join([
             (c.get("matched_fault_description") or c.get("fault_description") or ""),
             c.get("root_cause") or "", c.get("corrective_action") or ""
         ]).lower()
-        hits = sum(1 for k in keywords if k and k.lower() in text)
-        delta = min(CAP, BOOST * hits)
+        hits = sum(1 for k in kws if k in text)
+        delta = min(ANSWER_CAP, ANSWER_BOOST * hits)
         if not answer_yes:
             delta = -delta
         c["similarity"] = float(c.get("similarity", 0.0)) + delta
@@ -1,4 +1,4 @@
-from typing import Optional, List
+from typing import Optional, List, Dict
 from pydantic import BaseModel, Field
 
 class DiagnoseRequest(BaseModel):
@@ -8,6 +8,7 @@ class DiagnoseRequest(BaseModel):
     top_k: int = Field(10, ge=1, le=50, description="Maximum number of matches to return")
 
 class DiagnoseResponseItem(BaseModel):
+    id: int = Field(..., description="Row id; send back as candidate_ids to /narrow/*")
     component: str
     model: Optional[str] = None
     matched_fault_description: str
@@ -19,4 +20,9 @@ class ComponentsResponse(BaseModel):
     components: List[str]
 
 class ModelsResponse(BaseModel):
-    models: List[str]
\ No newline at end of file
+    models: List[str]
+
+class CatalogResponse(BaseModel):
+    components: List[str]
+    models: List[str] = Field(default_factory=list, description="Models of the requested component, if any")
+    models_by_component: Dict[str, List[str]] = Field(default_factory=dict, description="Every component's models, if requested")
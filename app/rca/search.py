@@ -1,19 +1,26 @@
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
+import asyncio
+import numpy as np
+from .config import QBATCH_MAX, QBATCH_WINDOW_MS
 from .embedder import OpenAIEmbedder
 from .index import RCAIndex
+from .semantic_cache import SemanticCache
+
+# (query, top_k, component, model)
+DiagnoseArgs = Tuple[str, int, Optional[str], Optional[str]]
 
 class QueryEngine:
     def __init__(self, index: RCAIndex, embedder: OpenAIEmbedder):
         self.index = index
         self.embedder = embedder
+        self.cache = SemanticCache()
 
-    def diagnose(self, query: str, top_k: int = 3, component: Optional[str] = None, model: Optional[str] = None) -> List[Dict]:
-        qv = self.embedder.embed_text(query)
-        results = self.index.search(qv, top_k=top_k, component=component, model=model)
+    def _rows(self, results: List[Tuple[int, float]]) -> List[Dict]:
         out = []
         for idx, score in results:
             row = self.index.meta[idx]
             out.append({
+                "id": int(idx),
                 "component": row.get("component"),
                 "model": row.get("model") or None,
                 "matched_fault_description": row.get("fault_description"),
@@ -22,3 +29,113 @@ class QueryEngine:
                 "similarity": float(score)
             })
         return out
+
+    def lookup(self, ids: List[int], scores: Optional[List[float]] = None) -> List[Dict]:
+        """Rows for ids previously returned by diagnose (e.g. candidates sent back by a client),
+        in the given order. Unknown ids are dropped."""
+        n = len(self.index.meta)
+        scores = scores if scores is not None else [0.0] * len(ids)
+        return self._rows([(i, s) for i, s in zip(ids, scores) if 0 <= i < n])
+
+    def diagnose(self, query: str, top_k: int = 3, component: Optional[str] = None, model: Optional[str] = None) -> List[Dict]:
+        return self.diagnose_many([(query, top_k, component, model)])[0]
+
+    def diagnose_many(self, reqs: List[DiagnoseArgs]) -> List[List[Dict]]:
+        """Answer several queries with one embedding call and one index search per filter set."""
+        out: List[Optional[List[Dict]]] = [None] * len(reqs)
+        pending = []
+        for i, (query, top_k, component, model) in enumerate(reqs):
+            out[i] = self.cache.get_exact((top_k, component, model), query)
+            if out[i] is None:
+                pending.append(i)
+        if not pending:
+            return out
+
+        Q = self.embedder.embed_texts([reqs[i][0] for i in pending])
+        Q /= np.linalg.norm(Q, axis=1, keepdims=True) + 1e-10
+        groups: Dict[Tuple[Optional[str], Optional[str]], List[Tuple[int, np.ndarray]]] = {}
+        for i, qv in zip(pending, Q):
+            _, top_k, component, model = reqs[i]
+            out[i] = self.cache.get_similar((top_k, component, model), qv)
+            if out[i] is None:
+                groups.setdefault((component, model), []).append((i, qv))
+
+        for (component, model), items in groups.items():
+            k = max(reqs[i][1] for i, _ in items)
+            results = self.index.search_batch(np.stack([qv for _, qv in items]), top_k=k, component=component, model=model)
+            for (i, qv), res in zip(items, results):
+                query, top_k, _, _ = reqs[i]
+                out[i] = self._rows(res[:top_k])
+                self.cache.put((top_k, component, model), query, qv, out[i])
+        return out
+
+class QueryBatcher:
+    """Coalesces concurrent diagnose calls: requests arriving within QBATCH_WINDOW_MS
+    (up to QBATCH_MAX) are answered by a single QueryEngine.diagnose_many call."""
+
+    def __init__(self, engine: QueryEngine, max_batch: int = QBATCH_MAX, window_ms: float = QBATCH_WINDOW_MS):
+        self.engine = engine
+        self.max_batch = max_batch
+        self.window = window_ms / 1000.0
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._inflight: set = set()  # strong refs so dispatch tasks aren't garbage-collected
+
+    async def submit(self, query: str, top_k: int = 3, component: Optional[str] = None, model: Optional[str] = None) -> List[Dict]:
+        # Exact repeats never need to wait for a batch
+        hit = self.engine.cache.get_exact((top_k, component, model), query)
+        if hit is not None:
+            return hit
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+        fut = asyncio.get_running_loop().create_future()
+        await self._queue.put(((query, top_k, component, model), fut))
+        return await fut
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.window
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            # Embedding + search block, so run them off the event loop; keep collecting meanwhile
+            task = asyncio.create_task(self._dispatch(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _dispatch(self, batch):
+        try:
+            results = await asyncio.to_thread(self.engine.diagnose_many, [args for args, _ in batch])
+        except Exception as e:
+            if len(batch) == 1:
+                _, fut = batch[0]
+                if not fut.done():
+                    fut.set_exception(e)
+                return
+            # Don't let one bad query (e.g. over the embedding token limit) fail its
+            # neighbours: answer each request on its own so only the culprit errors
+            await asyncio.gather(*(self._dispatch_one(args, fut) for args, fut in batch))
+            return
+        for (_, fut), res in zip(batch, results):
+            if not fut.done():
+                fut.set_result(res)
+
+    async def _dispatch_one(self, args: DiagnoseArgs, fut: asyncio.Future):
+        if fut.done():
+            return
+        try:
+            res = await asyncio.to_thread(self.engine.diagnose, *args)
+        except Exception as e:
+            if not fut.done():
+                fut.set_exception(e)
+            return
+        if not fut.done():
+            fut.set_result(res)
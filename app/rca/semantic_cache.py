@@ -0,0 +1,55 @@
+from __future__ import annotations
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional, Tuple
+import threading
+import numpy as np
+
+from .config import SEMCACHE_TAU, SEMCACHE_SIZE
+
+
+class SemanticCache:
+    """LRU of query -> (unit query vector, results).
+    Lookups match the exact query string first, then any cached query whose
+    cosine similarity to the new one is >= tau. Entries are scoped by `scope`
+    (search filters) so differently-filtered queries never share results.
+    """
+
+    def __init__(self, capacity: int = SEMCACHE_SIZE, tau: float = SEMCACHE_TAU):
+        self.capacity = capacity
+        self.tau = tau
+        self.lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple[Hashable, str], Tuple[np.ndarray, List[Dict]]]" = OrderedDict()
+
+    def get_exact(self, scope: Hashable, query: str) -> Optional[List[Dict]]:
+        key = (scope, query)
+        with self.lock:
+            hit = self._entries.get(key)
+            if hit is None:
+                return None
+            self._entries.move_to_end(key)
+            return [dict(r) for r in hit[1]]
+
+    def get_similar(self, scope: Hashable, qv: np.ndarray) -> Optional[List[Dict]]:
+        with self.lock:
+            keys = [k for k in self._entries if k[0] == scope]
+            if not keys:
+                return None
+            cached = np.stack([self._entries[k][0] for k in keys]).astype(np.float32, copy=False)
+            sims = cached @ qv
+            best = int(np.argmax(sims))
+            if sims[best] < self.tau:
+                return None
+            self._entries.move_to_end(keys[best])
+            return [dict(r) for r in self._entries[keys[best]][1]]
+
+    def put(self, scope: Hashable, query: str, qv: np.ndarray, results: List[Dict]):
+        with self.lock:
+            key = (scope, query)
+            self._entries[key] = (qv, [dict(r) for r in results])
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self._entries.clear()
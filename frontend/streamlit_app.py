@@ -1,20 +1,63 @@
 # frontend/streamlit_app.py
+import asyncio
+import gzip
+import hashlib
+import html
+import json
 import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+import httpx
+import numpy as np
+import pandas as pd
 import requests
 import streamlit as st
-from typing import List, Dict, Any
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import List, Dict, Any, Tuple
+
+try:
+    import orjson  # type: ignore
+except ImportError:  # pragma: no cover
+    orjson = None
 
 # -------------------- Config --------------------
 DEFAULT_BACKEND_URL = os.getenv("BACKEND_URL", "http://127.0.0.1:8000")
 MAX_RESULTS = 10
 MIN_SIMILARITY = 0.48
+CATALOG_TTL = 60  # seconds to cache /components and /models responses
+NARROW_MAX_STEPS = 6
+GAP_GOOD = 0.15
+SHORTLIST_COUNT = 1
+SPECULATION_WORKERS = 6  # speculative narrowing calls in flight across all sessions
+NARROW_MEMO_TTL = 300  # seconds a /narrow/next answer is reused
+NARROW_MEMO_SIZE = 512
+
+JSON_HEADERS = {"Content-Type": "application/json"}
+GZIP_MIN_BYTES = 1024  # smaller bodies aren't worth compressing
+
+def dumps(obj: Any) -> bytes:
+    return orjson.dumps(obj) if orjson is not None else json.dumps(obj).encode()
+
+def loads(raw: bytes) -> Any:
+    return orjson.loads(raw) if orjson is not None else json.loads(raw)
+
+def json_body(payload: Any) -> Tuple[bytes, Dict[str, str]]:
+    """Serialised payload and its headers, gzipped when larger than GZIP_MIN_BYTES."""
+    body = dumps(payload)
+    if len(body) > GZIP_MIN_BYTES:
+        return gzip.compress(body), {**JSON_HEADERS, "Content-Encoding": "gzip"}
+    return body, JSON_HEADERS
 
 st.set_page_config(page_title="RCA Demo", layout="wide")
 
+# st.fragment on newer Streamlit; 1.36 only ships the experimental name
+fragment = getattr(st, "fragment", None) or st.experimental_fragment
+
 # -------------------- Global styles --------------------
-st.markdown(
-    """
-<style>
+CSS_BLOB = """
 /* Hide Streamlit's "Press Ctrl+Enter to apply" hints */
 [data-testid="stTextArea"] div[aria-live="polite"] { display: none !important; }
 [data-testid="stTextInput"] div[aria-live="polite"] { display: none !important; }
@@ -30,10 +73,91 @@ div[data-baseweb="input"] + div p { display: none !important; }
 /* Result meta + anchor spacing */
 .result-meta { color:#666; font-size:0.85rem; }
 .anchor { scroll-margin-top: 80px; }
-</style>
+"""
+
+def inject_css_once():
+    """Append the stylesheet to the page <head> on a session's first run only. It outlives
+    the injector element, so later reruns send no style payload at all."""
+    if st.session_state.get("css_injected"):
+        return
+    st.components.v1.html(
+        f"""
+<script>
+const doc = parent.document;
+if (!doc.getElementById("rca-css")) {{
+  const el = doc.createElement("style");
+  el.id = "rca-css";
+  el.textContent = {json.dumps(CSS_BLOB)};
+  doc.head.appendChild(el);
+}}
+</script>
 """,
-    unsafe_allow_html=True,
-)
+        height=0,
+    )
+    st.session_state.css_injected = True
+
+inject_css_once()
+
+# -------------------- HTTP session (shared, keep-alive) --------------------
+@st.cache_resource
+def get_session() -> requests.Session:
+    s = requests.Session()
+    # Retry transient gateway errors (POSTs included: every endpoint is safe to repeat).
+    # read=0: a read timeout is never retried, so a slow LLM call can't block for
+    # several timeouts in a row. raise_on_status=False hands the last 5xx back to
+    # the caller's status checks. Every call still passes its own timeout.
+    retry = Retry(
+        total=2,
+        read=0,
+        backoff_factor=0.2,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset(["GET", "POST"]),
+        raise_on_status=False,
+    )
+    # Large enough that the speculative prefetches never queue for a connection
+    adapter = HTTPAdapter(pool_connections=20, pool_maxsize=50, max_retries=retry)
+    s.mount("http://", adapter)
+    s.mount("https://", adapter)
+    s.headers.update({"Connection": "keep-alive"})
+    return s
+
+def _post_json(sess: requests.Session, url: str, payload: Any, timeout: float = 60) -> requests.Response:
+    # Takes the session rather than calling get_session(): it also runs on speculation
+    # threads, which must not touch Streamlit APIs (cached functions included)
+    body, headers = json_body(payload)
+    return sess.post(url, data=body, headers=headers, timeout=timeout)
+
+@st.cache_resource
+def http2_client() -> httpx.Client:
+    # HTTP/2 is negotiated over TLS; plain-http backends transparently stay on HTTP/1.1
+    return httpx.Client(http2=True, timeout=120, limits=httpx.Limits(max_keepalive_connections=10))
+
+# -------------------- Speculation pool (narrowing answers computed ahead of time) --------------------
+@st.cache_resource
+def speculation_pool() -> Tuple[ThreadPoolExecutor, threading.BoundedSemaphore]:
+    # One slot per worker, so speculative work never queues behind other sessions'
+    return ThreadPoolExecutor(max_workers=SPECULATION_WORKERS), threading.BoundedSemaphore(SPECULATION_WORKERS)
+
+def speculate(fn, *args) -> Future | None:
+    """Run fn(*args) on the bounded speculation pool; None (nothing started) when
+    every slot is busy, in which case the caller just does the work on demand."""
+    executor, slots = speculation_pool()
+    if not slots.acquire(blocking=False):
+        return None
+    try:
+        # No script context: fn must be plain Python + HTTP, never st.* or cached functions
+        fut = executor.submit(fn, *args)
+    except Exception:
+        slots.release()
+        raise
+    fut.add_done_callback(lambda _: slots.release())
+    return fut
+
+def result_or(fut: Future, default, timeout: float = 10):
+    try:
+        return fut.result(timeout=timeout)
+    except Exception:
+        return default
 
 # -------------------- Scroll helpers (using st.query_params) --------------------
 def _do_rerun():
@@ -69,6 +193,10 @@ if "uploader_key" not in st.session_state:
     st.session_state.uploader_key = 0
 if "narrow" not in st.session_state:
     st.session_state.narrow = None
+if "catalog" not in st.session_state:
+    st.session_state.catalog = None  # last good {"key": api_base, "data": (components, models by component)}
+if "narrow_prefetch" not in st.session_state:
+    st.session_state.narrow_prefetch = {}  # {"qkey": ..., "futs": {answer: Future}}
 if "diag" not in st.session_state:
     st.session_state.diag = {"has_results": False, "query": "", "filtered": []}
 
@@ -77,11 +205,194 @@ st.title("Root Cause Analysis (RCA) Demo")
 st.caption("Describe a fault and get likely causes and recommended corrective actions.")
 render_scroll_script()
 
+# -------------------- Helpers --------------------
+def _clean_names(values: List[Any], drop_nan: bool = False) -> List[str]:
+    """Strip, lowercase, drop empties, de-dup and sort using pandas' vectorised string ops."""
+    s = pd.Series(values, dtype="string").str.strip().str.lower().dropna()
+    keep = s.str.len() > 0
+    if drop_nan:
+        keep &= s != "nan"
+    return s[keep].drop_duplicates().sort_values().tolist()
+
+# Cached for CATALOG_TTL seconds per api_base. Failures raise inside the cached function,
+# and Streamlit does not cache exceptions, so errors are retried next rerun.
+@st.cache_data(ttl=CATALOG_TTL, show_spinner=False)
+def _get_catalog(api_base: str) -> Tuple[List[str], Dict[str, List[str]]]:
+    resp = get_session().get(f"{api_base}/catalog", params={"all_models": "true"}, timeout=10)
+    resp.raise_for_status()
+    data = loads(resp.content)
+    comps = _clean_names(data.get("components", []))
+    by_comp = {
+        c.strip().lower(): _clean_names(ms, drop_nan=True)
+        for c, ms in (data.get("models_by_component") or {}).items()
+    }
+    return comps, by_comp
+
+def clear_catalog_cache():
+    _get_catalog.clear()
+    st.session_state.catalog = None
+
+def fetch_catalog(api_base: str) -> Tuple[List[str], Dict[str, List[str]]]:
+    """(components, {component: models}) from one /catalog call; ([], {}) on error.
+    Having every component's models lets the model dropdown be filtered client-side."""
+    try:
+        return _get_catalog(api_base)
+    except Exception:
+        return [], {}
+
+def with_sims(items: List[Dict[str, Any]], min_sim: float = float("-inf")) -> List[Dict[str, Any]]:
+    """Items scoring >= min_sim, each tagged with its similarity parsed once as `_sim`."""
+    sims = np.fromiter((float(it.get("similarity") or 0.0) for it in items), dtype=np.float64, count=len(items))
+    return [items[i] | {"_sim": float(sims[i])} for i in np.flatnonzero(sims >= min_sim)]
+
+def result_title(it: Dict[str, Any]) -> str:
+    """Heading "Component – Model"; stored on each result as `_title` so reruns don't rebuild it."""
+    parts = ((it.get("component") or "").strip(), (it.get("model") or "").strip())
+    return " – ".join(p.title() for p in parts if p and p.lower() != "nan") or "Result"
+
+def should_stop(cands: List[Dict[str, Any]], step: int) -> bool:
+    if len(cands) <= SHORTLIST_COUNT: return True
+    if step >= NARROW_MAX_STEPS: return True
+    if len(cands) >= 2 and step >= 1 and (cands[0]["_sim"] - cands[1]["_sim"]) >= GAP_GOOD:
+        return True
+    return False
+
+class NarrowMemo:
+    """Thread-safe LRU of /narrow/next answers, shared by all sessions. A plain dict and
+    lock instead of st.cache_data because speculation threads use it too."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.data: "OrderedDict[tuple, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+
+    def get(self, key: tuple) -> Dict[str, Any] | None:
+        with self.lock:
+            hit = self.data.get(key)
+            if hit is None:
+                return None
+            if time.time() - hit[0] > NARROW_MEMO_TTL:
+                del self.data[key]
+                return None
+            self.data.move_to_end(key)
+            return hit[1]
+
+    def put(self, key: tuple, value: Dict[str, Any]):
+        with self.lock:
+            self.data[key] = (time.time(), value)
+            self.data.move_to_end(key)
+            while len(self.data) > NARROW_MEMO_SIZE:
+                self.data.popitem(last=False)
+
+@st.cache_resource
+def narrow_memo() -> NarrowMemo:
+    return NarrowMemo()
+
+def fetch_next_question(sess: requests.Session, memo: NarrowMemo, api_base: str, query: str,
+                        candidates: List[Dict[str, Any]], asked: List[Dict[str, Any]]) -> Dict[str, Any] | None:
+    """POST /narrow/next, memoised on (query, top-5 candidates, asked history) so Skip and
+    no-op reruns don't repeat the LLM call; None if the backend fails (failures aren't
+    memoised). A question whose keywords were all asked already comes back with question=None."""
+    top = candidates[:5]
+    cache_key = (
+        api_base,
+        query,
+        tuple(c["id"] for c in top),
+        tuple(sorted((a.get("question") or "") for a in asked)),
+        tuple(sorted({kk for a in asked for kk in (a.get("keywords") or [])})),
+    )
+    data = memo.get(cache_key)
+    if data is None:
+        rq = _post_json(sess, f"{api_base}/narrow/next", {"query": query, "candidate_ids": list(cache_key[2]), "asked": asked})
+        if not rq.ok:
+            return None
+        data = loads(rq.content)
+        memo.put(cache_key, data)
+    already = {kk for a in asked for kk in (a.get("keywords") or [])}
+    if data.get("keywords") and all((kw in already) for kw in data["keywords"]):
+        return {"question": None, "keywords": []}
+    return data
+
+def advance_narrowing(sess: requests.Session, memo: NarrowMemo, api_base: str, query: str,
+                      nar: Dict[str, Any], answer: bool | None) -> Dict[str, Any] | None:
+    """Narrowing state after answering the current question (None = Skip), including the
+    following question when one is due. Pure apart from HTTP (no Streamlit calls), so it
+    can run speculatively on the pool. Returns None if /narrow/answer fails."""
+    q, kws = nar["question"], nar.get("keywords", [])
+    asked = list(nar.get("asked", [])) + [{"question": q, "keywords": kws, "answer": answer}]
+    cands, step, done = nar["candidates"], nar["step"], nar["done"]
+    if answer is not None:
+        rr = _post_json(sess, f"{api_base}/narrow/answer", {
+            "answer": answer,
+            "keywords": kws,
+            "candidate_ids": [c["id"] for c in cands],
+            "similarities": [c["_sim"] for c in cands],
+        })
+        if not rr.ok:
+            return None
+        # Similarities were re-scored by the backend; titles carry over by id
+        titles = {c["id"]: c.get("_title") for c in cands}
+        cands = with_sims(loads(rr.content).get("candidates", []))
+        for c in cands:
+            c["_title"] = titles.get(c["id"]) or result_title(c)
+        step += 1
+
+        # Progressive pruning
+        if len(cands) > 5 and step >= 1:
+            cands = cands[:5]
+        if len(cands) > 3 and step >= 2:
+            cands = cands[:3]
+        if len(cands) > 1 and (step >= 3 or should_stop(cands, step)):
+            cands = cands[:1]
+        done = len(cands) <= 1 or should_stop(cands, step)
+
+    nxt = None
+    if (not done) and (len(cands) > SHORTLIST_COUNT) and (step < NARROW_MAX_STEPS):
+        try:
+            nxt = fetch_next_question(sess, memo, api_base, query, cands, asked)
+        except Exception:
+            pass  # the results block retries on the next rerun
+    return {"candidates": cands, "step": step, "done": done, "asked": asked, "next": nxt}
+
+def cancel_prefetch():
+    for fut in (st.session_state.narrow_prefetch.get("futs") or {}).values():
+        fut.cancel()
+    st.session_state.narrow_prefetch = {}
+
+def question_key(q: str | None) -> str:
+    """Stable form key, computed once per question rather than hashed on every rerun."""
+    return hashlib.blake2b((q or "").encode(), digest_size=6).hexdigest()
+
+async def _diagnose_and_prefetch(api_base: str, payload: Dict[str, Any]):
+    """POST /diagnose and, when there is something to narrow, chain the first /narrow/next
+    on the same connection. Returns (response, filtered results, first question or None)."""
+    async with httpx.AsyncClient(base_url=api_base, timeout=120) as c:
+        body, headers = json_body(payload)
+        r = await c.post("/diagnose", content=body, headers=headers)
+        if not r.is_success:
+            return r, None, None
+        raw_results = loads(r.content) or []
+        filtered = with_sims(raw_results, MIN_SIMILARITY)
+        first_q = None
+        if len(filtered) > SHORTLIST_COUNT:
+            try:
+                body, headers = json_body({"query": payload["query"], "candidate_ids": [c["id"] for c in filtered[:5]], "asked": []})
+                rq = await c.post("/narrow/next", content=body, headers=headers, timeout=60)
+                if rq.is_success:
+                    first_q = loads(rq.content)
+            except Exception:
+                pass  # the results block fetches the question itself
+        return r, filtered, first_q
+
+def diagnose_and_prefetch(api_base: str, payload: Dict[str, Any]):
+    return asyncio.run(_diagnose_and_prefetch(api_base, payload))
+
 # -------------------- Sidebar (left): settings + upload --------------------
 with st.sidebar:
     st.header("Settings")
     backend_url = st.text_input("API URL", value=DEFAULT_BACKEND_URL, help="FastAPI backend base URL")
     st.caption(f"Requesting up to {MAX_RESULTS} results; showing those with similarity ≥ {MIN_SIMILARITY:.2f}.")
+    if st.button("Refresh catalog", use_container_width=True, help="Reload the component and model lists"):
+        clear_catalog_cache()
     st.divider()
 
     st.header("Add data")
@@ -100,12 +411,15 @@ with st.sidebar:
         )
         add_clicked = st.button("Add to knowledge base", use_container_width=True)
         if up and add_clicked:
-            files = {"file": (up.name, up.getvalue(), "text/csv")}
+            up.seek(0)
+            # Pass the UploadedFile itself so httpx streams it instead of copying the bytes
+            files = {"file": (up.name, up, "text/csv")}
             try:
-                r = requests.post(f"{backend_url}/ingest", files=files, timeout=120)
-                if r.ok:
-                    data = r.json()
+                r = http2_client().post(f"{backend_url}/ingest", files=files)
+                if r.is_success:
+                    data = loads(r.content)
                     st.success(f"Added {data.get('added', 0)} rows.")
+                    clear_catalog_cache()
                     st.session_state.hide_uploader = True
                     st.session_state.uploader_key += 1
                     _do_rerun()
@@ -114,28 +428,6 @@ with st.sidebar:
             except Exception as e:
                 st.error(f"Error: {e}")
 
-# -------------------- Helpers --------------------
-def fetch_components(api_base: str) -> List[str]:
-    try:
-        resp = requests.get(f"{api_base}/components", timeout=10)
-        if resp.ok:
-            comps = resp.json().get("components", [])
-            return sorted({str(c).strip().lower() for c in comps if str(c).strip()})
-    except Exception:
-        pass
-    return []
-
-def fetch_models(api_base: str, component: str) -> List[str]:
-    try:
-        resp = requests.get(f"{api_base}/models", params={"component": component}, timeout=10)
-        if resp.ok:
-            models = resp.json().get("models", [])
-            cleaned = {str(m).strip().lower() for m in models if str(m).strip() and str(m).strip().lower() != "nan"}
-            return sorted(cleaned)
-    except Exception:
-        pass
-    return []
-
 # ============================================================
 # Main two-column content area (inputs + results left; narrowing right)
 # ============================================================
@@ -164,24 +456,32 @@ No follow-up question yet.<br/>
 
 # -------------------- Left: Inputs (width limited by the right column) --------------------
 with left:
-    components = fetch_components(backend_url)
+    components, models_by_component = fetch_catalog(backend_url)
+    catalog = st.session_state.catalog
+    if components:
+        st.session_state.catalog = {"key": backend_url, "data": (components, models_by_component)}
+    elif catalog is not None and catalog["key"] == backend_url:
+        # Fetch failed: keep the last good catalog so the chosen filter survives
+        components, models_by_component = catalog["data"]
+    # Outside the form so the model dropdown below can follow it
     component_display = st.selectbox("Component (optional filter)", options=["All"] + [c.title() for c in components], index=0)
 
-    model_display = None
-    models: List[str] = []
-    if component_display != "All":
-        selected_component = component_display.lower()
-        models = fetch_models(backend_url, selected_component)
-        model_options = ["All models"] + [m.title() for m in models] if models else ["All models"]
-        model_display = st.selectbox("Model (optional)", options=model_options, index=0)
-
-    query = st.text_area(
-        "Describe the fault",
-        placeholder="e.g. Motor (ABB M3BP 160MLA 4) making a high-pitched squeal and smells burnt…",
-        height=120,
-    )
+    # Typing in the form doesn't rerun the script; only the Diagnose click does
+    with st.form("diagnose_form", clear_on_submit=False, border=False):
+        model_display = None
+        if component_display != "All":
+            models = models_by_component.get(component_display.lower(), [])
+            model_options = ["All models"] + [m.title() for m in models]
+            model_display = st.selectbox("Model (optional)", options=model_options, index=0)
+
+        query = st.text_area(
+            "Describe the fault",
+            placeholder="e.g. Motor (ABB M3BP 160MLA 4) making a high-pitched squeal and smells burnt…",
+            height=120,
+        )
+        submitted = st.form_submit_button("Diagnose", type="primary")
 
-    if st.button("Diagnose", type="primary"):
+    if submitted:
         if not query.strip():
             st.warning("Please enter a fault description.")
         else:
@@ -193,35 +493,101 @@ with left:
 
             with st.spinner("Analysing…"):
                 try:
-                    r = requests.post(f"{backend_url}/diagnose", json=payload, timeout=120)
+                    r, filtered, first_q = diagnose_and_prefetch(backend_url, payload)
                 except Exception as e:
                     r = None
                     st.error(f"Request failed: {e}")
 
             if r is not None:
-                if r.ok:
-                    raw_results = r.json() or []
-                    try:
-                        filtered = [it for it in raw_results if float(it.get("similarity", 0.0)) >= MIN_SIMILARITY]
-                    except Exception:
-                        filtered = raw_results
-
+                if r.is_success:
+                    for it in filtered:
+                        it["_title"] = result_title(it)
                     st.session_state.diag = {"has_results": True, "query": query, "filtered": filtered}
                     st.session_state.narrow = {
                         "candidates": filtered,
                         "step": 0,
                         "question": None,
+                        "question_key": None,
                         "keywords": [],
                         "base_query": query,
                         "done": False,
                         "asked": [],
                     }
+                    if first_q and first_q.get("question"):
+                        # Prefetched: the next rerun skips its own /narrow/next call
+                        st.session_state.narrow.update(
+                            question=first_q["question"],
+                            question_key=question_key(first_q["question"]),
+                            keywords=first_q.get("keywords", []),
+                        )
                     st.success(f"Matches found: {len(filtered)}")
                     set_scroll_anchor("results_anchor")
                     _do_rerun()
                 else:
                     st.error(f"API error: {r.status_code} {r.text}")
 
+# -------------------- Results list + narrowing rail (fragments) --------------------
+@fragment
+def render_results(list_to_show: List[Dict[str, Any]]):
+    for i, item in enumerate(list_to_show, start=1):
+        # One message per result; fields come from user-uploaded CSVs, so escape them
+        md = (
+            f"### {i}. {html.escape(item['_title'])}\n\n"
+            f"**Matched fault:** {html.escape(item.get('matched_fault_description') or '')}\n\n"
+            f"**Root cause:** {html.escape(item.get('root_cause') or '')}\n\n"
+            f"**Corrective action:** {html.escape(item.get('corrective_action') or '')}\n\n"
+            f"<span class='result-meta'>Similarity: {item['_sim']:.3f}</span>\n\n---"
+        )
+        st.markdown(md, unsafe_allow_html=True)
+
+@fragment
+def render_rail(backend_url: str, query: str):
+    """Question + answer form. A fragment: submitting the form reruns only this function;
+    the full app reruns once, via st.rerun(), after the answer has been applied."""
+    nar = st.session_state.narrow
+    q = nar.get("question")
+    # Speculatively work out every possible answer while the user reads the question
+    if st.session_state.narrow_prefetch.get("qkey") != nar["question_key"]:
+        cancel_prefetch()
+        snapshot = {k: nar[k] for k in ("question", "keywords", "candidates", "step", "done", "asked")}
+        st.session_state.narrow_prefetch = {
+            "qkey": nar["question_key"],
+            "futs": {},
+        }
+        for ans in (True, False, None):
+            fut = speculate(advance_narrowing, get_session(), narrow_memo(), backend_url, query, snapshot, ans)
+            if fut is None:
+                break  # pool saturated; answers are computed on submit instead
+            st.session_state.narrow_prefetch["futs"][ans] = fut
+
+    st.markdown(f'<div class="rail-q">{q}</div>', unsafe_allow_html=True)
+    with st.form(key=f"narrow_form_{nar['question_key']}", clear_on_submit=True):
+        choice = st.radio("Answer", options=["Yes", "No", "Skip"], horizontal=True, index=0)
+        submitted = st.form_submit_button("Apply")
+
+    if submitted:
+        ans = None if choice == "Skip" else (choice == "Yes")
+        fut = st.session_state.narrow_prefetch.get("futs", {}).get(ans)
+        nxt_state = result_or(fut, None, timeout=60) if fut is not None and not fut.cancelled() else None
+        try:
+            if nxt_state is None:
+                # Speculation missed or failed: do it now
+                nxt_state = advance_narrowing(get_session(), narrow_memo(), backend_url, query, nar, ans)
+            if nxt_state is not None:
+                nxt = nxt_state.pop("next") or {}
+                nar.update(nxt_state)
+                nar["question"] = nxt.get("question")
+                nar["keywords"] = nxt.get("keywords", []) if nar["question"] else []
+                nar["question_key"] = question_key(nar["question"])
+                cancel_prefetch()
+                set_scroll_anchor("results_anchor")
+                _do_rerun()
+            else:
+                st.error("Could not apply the answer.")
+        except Exception as e:
+            st.error(f"Apply error: {e}")
+            nar["done"] = True
+
 # -------------------- Results + Narrowing logic --------------------
 diag = st.session_state.diag
 if diag.get("has_results"):
@@ -233,45 +599,23 @@ if diag.get("has_results"):
             "candidates": filtered,
             "step": 0,
             "question": None,
+            "question_key": None,
             "keywords": [],
             "base_query": diag["query"],
             "done": False,
             "asked": [],
         }
         st.session_state.narrow = nar
-
-    NARROW_MAX_STEPS = 6
-    GAP_GOOD = 0.15
-    SHORTLIST_COUNT = 1
-
-    def should_stop(cands: List[Dict[str, Any]], step: int) -> bool:
-        if len(cands) <= SHORTLIST_COUNT: return True
-        if step >= NARROW_MAX_STEPS: return True
-        if len(cands) >= 2:
-            try:
-                s0 = float(cands[0].get("similarity", 0.0))
-                s1 = float(cands[1].get("similarity", 0.0))
-                if (s0 - s1) >= GAP_GOOD and step >= 1: return True
-            except Exception:
-                pass
-        return False
+        cancel_prefetch()
 
     # Auto-fetch a narrowing question if needed
     if (not nar["done"]) and (nar["question"] is None) and (len(nar["candidates"]) > SHORTLIST_COUNT) and (nar["step"] < NARROW_MAX_STEPS):
         try:
-            rq = requests.post(
-                f"{backend_url}/narrow/next",
-                json={"query": diag["query"], "candidates": nar["candidates"][:5], "asked": nar.get("asked", [])},
-                timeout=60,
-            )
-            if rq.ok:
-                data = rq.json()
+            data = fetch_next_question(get_session(), narrow_memo(), backend_url, diag["query"], nar["candidates"], nar.get("asked", []))
+            if data is not None:
                 nar["question"] = data.get("question")
                 nar["keywords"] = data.get("keywords", [])
-                already = {kk for a in nar.get("asked", []) for kk in (a.get("keywords") or [])}
-                if nar["keywords"] and all((kw in already) for kw in nar["keywords"]):
-                    nar["question"] = None
-                    nar["keywords"] = []
+                nar["question_key"] = question_key(nar["question"])
             else:
                 nar["done"] = True
         except Exception as e:
@@ -288,72 +632,14 @@ if diag.get("has_results"):
         if not list_to_show:
             st.info("No strong matches found. Try rephrasing or loosen the filters.")
         else:
-            for i, item in enumerate(list_to_show, start=1):
-                comp = (item.get('component') or '').title()
-                model_raw = (item.get('model') or '').strip()
-                model_txt = model_raw if model_raw and model_raw.lower() != "nan" else ""
-                title = " – ".join([t for t in (comp, model_txt.title() if model_txt else "") if t]) or "Result"
-
-                st.markdown(f"### {i}. {title}")
-                st.markdown(f"**Matched fault:** {item.get('matched_fault_description','')}")
-                st.markdown(f"**Root cause:** {item.get('root_cause','')}")
-                st.markdown(f"**Corrective action:** {item.get('corrective_action','')}")
-                try:
-                    st.caption(f"Similarity: {float(item.get('similarity', 0.0)):.3f}")
-                except Exception:
-                    pass
-                st.divider()
+            render_results(list_to_show)
 
     # -------- Right column: overwrite placeholder with question (if any) --------
     with right:
-        q = nar.get("question")
-        kws = nar.get("keywords", [])
-        if q and not nar["done"]:
+        if nar.get("question") and not nar["done"]:
             rail_body.empty()
             with rail_body.container():
-                st.markdown(f'<div class="rail-q">{q}</div>', unsafe_allow_html=True)
-                with st.form(key=f"narrow_form_{abs(hash(q)) % (10**8)}", clear_on_submit=True):
-                    choice = st.radio("Answer", options=["Yes", "No", "Skip"], horizontal=True, index=0)
-                    submitted = st.form_submit_button("Apply")
-
-                if submitted:
-                    if choice == "Skip":
-                        nar.setdefault("asked", []).append({"question": q, "keywords": kws, "answer": None})
-                        nar["question"] = None
-                        nar["keywords"] = []
-                        set_scroll_anchor("results_anchor")
-                        _do_rerun()
-                    else:
-                        ans = (choice == "Yes")
-                        try:
-                            rr = requests.post(
-                                f"{backend_url}/narrow/answer",
-                                json={"answer": ans, "keywords": kws, "candidates": nar["candidates"]},
-                                timeout=60,
-                            )
-                            if rr.ok:
-                                nar["candidates"] = rr.json().get("candidates", [])
-                                nar.setdefault("asked", []).append({"question": q, "keywords": kws, "answer": ans})
-                                nar["question"] = None
-                                nar["keywords"] = []
-                                nar["step"] += 1
-
-                                # Progressive pruning
-                                if len(nar["candidates"]) > 5 and nar["step"] >= 1:
-                                    nar["candidates"] = nar["candidates"][:5]
-                                if len(nar["candidates"]) > 3 and nar["step"] >= 2:
-                                    nar["candidates"] = nar["candidates"][:3]
-                                if len(nar["candidates"]) > 1 and (nar["step"] >= 3 or should_stop(nar["candidates"], nar["step"])):
-                                    nar["candidates"] = nar["candidates"][:1]
-
-                                nar["done"] = len(nar["candidates"]) <= 1 or should_stop(nar["candidates"], nar["step"])
-                                set_scroll_anchor("results_anchor")
-                                _do_rerun()
-                            else:
-                                st.error("Could not apply the answer.")
-                        except Exception as e:
-                            st.error(f"Apply error: {e}")
-                            nar["done"] = True
+                render_rail(backend_url, diag["query"])
         else:
             # Keep the initial tips visible (rail_body already holds them)
             if nar.get("done"):